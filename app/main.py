@@ -1,13 +1,50 @@
+import shutil
+import tempfile
+import tomllib
+
 import streamlit as st
 from src.looksee import LookSee
-import toml
 from pathlib import Path
 
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # Copy uploads to disk 4 MiB at a time
+
+
+def get_looksee():
+    """
+    Create the LookSee instance for this session once and reuse it across
+    Streamlit reruns. Sessions run in their own threads, so each needs its own
+    instance (and DuckDB cursor); the database itself is shared.
+    """
+    if "looksee" not in st.session_state:
+        st.session_state["looksee"] = LookSee()
+    return st.session_state["looksee"]
+
+
+@st.cache_data
+def load_demo_datasets(demo_datasets_path):
+    """
+    Load the demo dataset definitions, cached across Streamlit reruns.
+    """
+    with open(demo_datasets_path, "rb") as f:
+        return tomllib.load(f)["datasets"]
+
+
+def replace_session_upload(upload_path):
+    """
+    Record the current upload of this session and delete the previous one, so
+    replaced or cleared uploads do not accumulate in the temp directory.
+    """
+    previous_path = st.session_state.get("upload_path")
+    if previous_path and previous_path != upload_path:
+        Path(previous_path).unlink(missing_ok=True)
+    st.session_state["upload_path"] = upload_path
+
+
 def main():
     st.title("Data Investigation Tool")
 
     # Load LookSee instance
-    looksee = LookSee()
+    looksee = get_looksee()
 
     # Sidebar for data selection
     st.sidebar.header("Select Dataset")
@@ -20,8 +57,7 @@ def main():
     # Option to select a demo dataset
     demo_datasets_path = Path.cwd() / "app" / "demo_datasets.toml"
     try:
-        with open(demo_datasets_path, "r") as f:
-            demo_datasets = toml.load(f)["datasets"]
+        demo_datasets = load_demo_datasets(demo_datasets_path)
         demo_dataset_names = list(demo_datasets.keys())
         selected_demo_dataset = st.sidebar.selectbox("Select a Demo Dataset", ["None"] + demo_dataset_names)
     except FileNotFoundError:
@@ -31,16 +67,26 @@ def main():
 
     # Process data
     dataset_path = None
-    uploaded_file_name = None  # Store the uploaded file name
+
+    if data_file is None:
+        replace_session_upload(None)  # Delete the upload if it was cleared
 
     if data_file is not None:
         try:
-            # Write the uploaded file to a temporary file
-            temp_path = "temp_file"
-            with open(temp_path, "wb") as f:
-                f.write(data_file.getbuffer())
+            # Stream the upload to a temporary file that keeps the original
+            # extension, so the file type can be read from the path. The name is
+            # tied to the upload so reruns reuse the file instead of rewriting it.
+            suffix = Path(data_file.name).suffix
+            temp_path = Path(tempfile.gettempdir()) / f"looksee-{data_file.file_id}{suffix}"
+            if not temp_path.exists():
+                data_file.seek(0)
+                with tempfile.NamedTemporaryFile(
+                    dir=temp_path.parent, suffix=suffix, delete=False
+                ) as f:
+                    shutil.copyfileobj(data_file, f, length=UPLOAD_CHUNK_SIZE)
+                Path(f.name).replace(temp_path)
+            replace_session_upload(temp_path)
             dataset_path = temp_path
-            uploaded_file_name = data_file.name  # Get the uploaded file name
             st.success(f"File '{data_file.name}' uploaded successfully!")
         except Exception as e:
             st.error(f"Error writing uploaded file: {e}")
@@ -52,23 +98,19 @@ def main():
 
     if dataset_path:
         try:
-            # Pass the file name to ingest_data so it can get the extension
-            if looksee.ingest_data(dataset_path, uploaded_file_name):
+            if looksee.ingest_data(dataset_path):
                 looksee.extract_metadata()
 
                 # Display Metadata
                 st.header("Metadata")
-                metadata = looksee.display_metadata()
-                if metadata:
-                    st.dataframe(metadata)  # Display metadata as a dataframe
+                if looksee.display_metadata():
+                    st.dataframe(looksee.metadata_arrow)  # Display metadata as a dataframe
                 else:
                     st.warning("No metadata available.")
 
                 # Column Explorer
                 st.header("Column Explorer")
-                columns_query = f"SELECT column_name FROM information_schema.columns WHERE table_name='{looksee.table_name}'"
-                columns = [col[0] for col in looksee.conn.execute(columns_query).fetchall()]
-                selected_column = st.selectbox("Select a column to explore:", columns)
+                selected_column = st.selectbox("Select a column to explore:", looksee.columns)
 
                 if selected_column:
                     summary_stats = looksee.column_summary(selected_column)
@@ -1,11 +1,63 @@
+import hashlib
+import os
 import subprocess
+import tempfile
+import threading
+import time
+import tomllib
+import weakref
+from functools import cache
 from pathlib import Path
 
 import duckdb
-import toml
 from loguru import logger
 from tabulate import tabulate
-from functools import cache
+
+# Log files that already have a loguru sink, so repeated LookSee construction
+# does not add duplicate handlers
+_log_sinks = set()
+
+# Live LookSee instances, used to tell whether another instance still reads a
+# dataset view, and the lock serialising view changes between them
+_instances = weakref.WeakSet()
+_views_lock = threading.Lock()
+
+
+@cache
+def _shared_connection():
+    """
+    Open the in-memory DuckDB database shared by all LookSee instances in this
+    process. Each instance works through its own cursor, and each source file
+    gets its own view, so instances loading the same file share it without
+    seeing each other's other datasets.
+    """
+    return duckdb.connect(database=":memory:", read_only=False)
+
+
+def is_numeric_type(data_type):
+    """
+    Check whether a DuckDB data type (as reported by information_schema) is numeric.
+    """
+    return data_type.startswith("DECIMAL") or data_type in (
+        "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+        "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT",
+        "FLOAT", "DOUBLE",
+    )
+
+
+def quote_identifier(name):
+    """
+    Quote a table or column name for use in a DuckDB SQL statement.
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def quote_literal(value):
+    """
+    Quote a string literal for statements that cannot take bound parameters
+    (COPY and CREATE VIEW).
+    """
+    return "'" + str(value).replace("'", "''") + "'"
 
 
 class LookSee:
@@ -14,19 +66,33 @@ class LookSee:
         try:
             config_path = Path.cwd() / "app" / config_path
             print(f"config_path: {config_path}")
-            with open(config_path, "r") as f:
-                self.config = toml.load(f)
+            with open(config_path, "rb") as f:
+                self.config = tomllib.load(f)
         except FileNotFoundError:
             raise FileNotFoundError(f"Configuration file '{config_path}' not found.")
         except Exception as e:
             raise RuntimeError(f"Error loading configuration file '{config_path}': {e}")
 
         # Initialize DuckDB connection and settings
-        self.conn = duckdb.connect(database=":memory:", read_only=False)
-        self.table_name = self.config["settings"].get("default_table_name", "dataset")
-        logger.add(
-            self.config["settings"].get("log_file", "looksee.log"), rotation="2 MB"
-        )
+        # Each instance gets its own cursor on the shared database; a cursor must
+        # not be used from several threads at once
+        self.conn = _shared_connection().cursor()
+        # Prefix of the view created for each ingested file
+        self.table_prefix = self.config["settings"].get("default_table_name", "dataset")
+        self.table_name = self.table_prefix
+        self._table = quote_identifier(self.table_name)
+        self.cache_dir = Path.cwd() / self.config["settings"].get("cache_dir", "cache")
+        self.remote_cache_hours = self.config["settings"].get("remote_cache_hours", 24)
+        self.cache_max_files = self.config["settings"].get("cache_max_files", 20)
+        self._col_types = {}
+        self._summary_statements = {}
+        self._last_ingested = None
+        self._metadata_table = None  # Table the current metadata was extracted from
+        _instances.add(self)
+        log_file = self.config["settings"].get("log_file", "looksee.log")
+        if log_file not in _log_sinks:
+            logger.add(log_file, rotation="2 MB")
+            _log_sinks.add(log_file)
 
         logger.info("LookSee initialized with configuration from looksee.toml.")
 
@@ -36,37 +102,190 @@ class LookSee:
         """
         read_functions = self.config["read_functions"]
         return read_functions.get(file_type.lower())
-    
-    @cache
-    def ingest_data(self, file_path, uploaded_file_name=None):
+
+    def _get_read_options(self, read_function):
+        """
+        Format the options configured for a DuckDB read function as SQL
+        named arguments, e.g. ", header=true, sample_size=20480".
+        """
+        options = self.config.get("read_options", {}).get(read_function, {})
+        arguments = []
+        for name, value in options.items():
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            elif isinstance(value, str):
+                value = quote_literal(value)
+            arguments.append(f", {name}={value}")
+        return "".join(arguments)
+
+    @staticmethod
+    def _file_signature(file_path, file_type):
+        """
+        Identify a version of a source file by its path, type, modification time
+        and size. Remote URLs (or anything else that cannot be stat'ed) are
+        identified by their path and type only.
+        """
+        try:
+            stat = os.stat(file_path)
+            return (file_path, file_type, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return (file_path, file_type, None, None)
+
+    def _table_exists(self):
+        """
+        Check whether the dataset table or view exists in the connection.
+        """
+        query = "SELECT 1 FROM information_schema.tables WHERE table_name = ?"
+        return self.conn.execute(query, [self.table_name]).fetchone() is not None
+
+    def _source_key(self, signature, read_function):
+        """
+        Key identifying a version of a source file read with the current read
+        options, so an edited file or a change of options gets a new key.
+        """
+        read_options = self._get_read_options(read_function)
+        return hashlib.sha256(repr((signature, read_options)).encode()).hexdigest()[:16]
+
+    def _cache_path(self, signature, read_function):
+        """
+        Path of the cached Parquet file for a source file.
+        """
+        return self.cache_dir / f"{self._source_key(signature, read_function)}.parquet"
+
+    def _is_cache_current(self, parquet_path, signature):
+        """
+        Check whether a cached Parquet file exists and is current. Remote files
+        (without a modification time) go stale once their cached copy is older
+        than remote_cache_hours.
+        """
+        if not parquet_path.exists():
+            return False
+        if signature[2] is not None:
+            return True
+        age_hours = (time.time() - parquet_path.stat().st_mtime) / 3600
+        return age_hours < self.remote_cache_hours
+
+    def _cache_as_parquet(self, file_path, signature, read_function):
+        """
+        Convert the source file to Parquet once and return the cached file path.
+        """
+        parquet_path = self._cache_path(signature, read_function)
+
+        if self._is_cache_current(parquet_path, signature):
+            logger.info(f"Using cached Parquet file {parquet_path} for {file_path}.")
+            return parquet_path
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so a failed conversion never leaves a
+        # partial file behind in the cache. Each conversion gets its own file, as
+        # several sessions may convert the same source at once.
+        with tempfile.NamedTemporaryFile(
+            dir=self.cache_dir, suffix=".parquet.tmp", delete=False
+        ) as f:
+            temp_path = Path(f.name)
+        read_options = self._get_read_options(read_function)
+        query = f"""
+        COPY (
+            SELECT * FROM {read_function}({quote_literal(file_path)}{read_options})
+        ) TO {quote_literal(temp_path)} (FORMAT PARQUET, COMPRESSION ZSTD)
+        """
+        try:
+            logger.debug(query.strip())
+            self.conn.execute(query)
+            temp_path.replace(parquet_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        logger.info(f"Cached {file_path} as Parquet file {parquet_path}.")
+        return parquet_path
+
+    def _prune_cache(self):
+        """
+        Delete the oldest cached Parquet files beyond cache_max_files. Files that
+        a view still reads (possibly another session's) are kept.
+        """
+        views = self.conn.execute(
+            "SELECT sql FROM duckdb_views() WHERE NOT internal"
+        ).fetchall()
+        in_use = {
+            path
+            for path in self.cache_dir.glob("*.parquet")
+            if any(quote_literal(path) in sql for (sql,) in views)
+        }
+        cached = sorted(
+            (path for path in self.cache_dir.glob("*.parquet") if path not in in_use),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+        for path in cached[max(self.cache_max_files - len(in_use), 0):]:
+            logger.info(f"Removing cached Parquet file {path}.")
+            path.unlink(missing_ok=True)
+
+    def ingest_data(self, file_path):
         try:
             file_path = str(file_path)
-            if uploaded_file_name:
-                file_type = Path(uploaded_file_name).suffix[1:]  # Use uploaded file name
-            else:
-                file_type = Path(file_path).suffix[1:]
+            file_type = Path(file_path).suffix[1:]
             read_function = self._get_duckdb_read_function(file_type)
 
             if not read_function:
                 raise ValueError(f"Unsupported file format: {file_type}")
 
-            self.conn.execute(f"DROP TABLE IF EXISTS {self.table_name}")
-
-            query = f"""
-            CREATE TABLE {self.table_name} AS 
-            SELECT * FROM {read_function}('{file_path}', 
-                                            sample_size=20480, 
-                                            all_varchar=false)
-            """
-            self.conn.execute(query)
-            print(query.strip())
+            # Skip the work when the same, unchanged file is already loaded and
+            # its cached Parquet copy is still there and current
+            signature = self._file_signature(file_path, file_type)
+            if read_function == "read_parquet":
+                cache_current = True
+            else:
+                cache_current = self._is_cache_current(
+                    self._cache_path(signature, read_function), signature
+                )
+            if signature == self._last_ingested and cache_current and self._table_exists():
+                logger.info(f"Data from {file_path} is already ingested.")
+                return True
+            self._last_ingested = None
+            self._metadata_table = None
+
+            if read_function == "read_parquet":
+                # Already columnar, so query the source directly
+                source = f"read_parquet({quote_literal(file_path)}{self._get_read_options(read_function)})"
+            else:
+                parquet_path = self._cache_as_parquet(file_path, signature, read_function)
+                source = f"read_parquet({quote_literal(parquet_path)})"
+
+            # The view name identifies the file version, so an existing view
+            # (e.g. created by another Streamlit session) already has this data
+            # and views used by other instances are never replaced
+            with _views_lock:
+                previous_table = self.table_name
+                self.table_name = f"{self.table_prefix}_{self._source_key(signature, read_function)}"
+                self._table = quote_identifier(self.table_name)
+                query = f"""
+                CREATE VIEW IF NOT EXISTS {self._table} AS
+                SELECT * FROM {source}
+                """
+                self.conn.execute(query)
+                print(query.strip())
+
+                # Drop the previous view once no instance reads it, so its cached
+                # file can be pruned
+                if previous_table != self.table_name and not any(
+                    looksee.table_name == previous_table for looksee in _instances
+                ):
+                    self.conn.execute(f"DROP VIEW IF EXISTS {quote_identifier(previous_table)}")
+
+                if read_function != "read_parquet":
+                    self._prune_cache()
             logger.info(f"Data ingested successfully from {file_path}.")
-
-            validation_results = self.validate_column_types()
-            if validation_results:
-                logger.warning("Column type validation issues found:")
-                for result in validation_results:
-                    logger.warning(result)
+            self._cache_column_types()
+            self._last_ingested = signature
+
+            # DuckDB already typed the columns when reading the file, so this
+            # extra scan is opt-in
+            if self.config["settings"].get("validate_column_types", False):
+                validation_results = self.validate_column_types()
+                if validation_results:
+                    logger.warning("Column type validation issues found:")
+                    for result in validation_results:
+                        logger.warning(result)
 
             return True  # Return True if ingestion was successful, regardless of validation results
 
@@ -79,22 +298,24 @@ class LookSee:
         """
         Validate column types for the current table.
         """
-        query = f"""
-        SELECT column_name, data_type
-        FROM duckdb_columns()
-        WHERE table_name = '{self.table_name}'
-        """
-        columns = self.conn.execute(query).fetchall()
+        # Reuse the column types cached at ingest time
+        columns = list(self._col_types.items())
         logger.info(f"Columns detected: {columns}")
 
+        if not columns:
+            return []
+
+        # Count the mismatches for every column in a single scan
+        counts = ",\n".join(
+            f"COUNT(*) FILTER (WHERE TRY_CAST({quote_identifier(col_name)} AS {data_type}) IS NULL"
+            f" AND {quote_identifier(col_name)} IS NOT NULL)"
+            for col_name, data_type in columns
+        )
+        validation_query = f"SELECT {counts} FROM {self._table}"
+        invalid_counts = self.conn.execute(validation_query).fetchone()
+
         validation_results = []
-        for col_name, data_type in columns:
-            validation_query = f"""
-            SELECT COUNT(*) FROM {self.table_name}
-            WHERE CAST({col_name} AS {data_type}) IS NULL
-            AND {col_name} IS NOT NULL
-            """
-            invalid_count = self.conn.execute(validation_query).fetchone()[0]
+        for (col_name, data_type), invalid_count in zip(columns, invalid_counts):
             if invalid_count > 0:
                 validation_results.append(
                     f"Column {col_name} has {invalid_count} rows that don't match type {data_type}"
@@ -104,100 +325,168 @@ class LookSee:
 
     def extract_metadata(self):
         """
-        Extract metadata for the dataset.
+        Extract metadata for the dataset. Does nothing when the metadata was
+        already extracted since the dataset was last ingested.
         """
+        if self._metadata_table == self.table_name:
+            return
+
         try:
-            # Query column names and data types
-            column_info_query = f"""
-                SELECT column_name, data_type
-                FROM information_schema.columns
-                WHERE table_name = '{self.table_name}';
+            # One struct of statistics per column, all aggregated in a single scan
+            # and unnested into one row per column
+            column_stats = []
+            for column_name, data_type in self._col_types.items():
+                column = quote_identifier(column_name)
+                if is_numeric_type(data_type):
+                    mean_value = f"CAST(AVG({column}) AS DOUBLE)"
+                    std_dev = f"CAST(STDDEV({column}) AS DOUBLE)"
+                else:
+                    mean_value = std_dev = "CAST(NULL AS DOUBLE)"
+                column_stats.append(f"""{{
+                    'column_name': {quote_literal(column_name)},
+                    'data_type': {quote_literal(data_type)},
+                    'total_rows': COUNT(*),
+                    'null_count': COUNT(*) - COUNT({column}),
+                    'unique_count': APPROX_COUNT_DISTINCT({column}),
+                    'min_value': CAST(MIN({column}) AS VARCHAR),
+                    'max_value': CAST(MAX({column}) AS VARCHAR),
+                    'mean_value': {mean_value},
+                    'std_dev': {std_dev}
+                }}""")
+            query = f"""
+                SELECT UNNEST(column_stats, recursive := true)
+                FROM (SELECT [{", ".join(column_stats)}] AS column_stats FROM {self._table});
             """
-            columns_info = self.conn.execute(column_info_query).fetchall()
-
-            metadata = []
-            for column_name, data_type in columns_info:
-                # Query to get total rows, null count, and unique count for each column
-                query = f"""
-                    SELECT 
-                        (SELECT COUNT(*) FROM {self.table_name}) AS total_rows,
-                        COUNT(*) - COUNT("{column_name}") AS null_count,
-                        COUNT(DISTINCT "{column_name}") AS unique_count
-                    FROM {self.table_name};
-                """
-                result = self.conn.execute(query).fetchone()
-                total_rows, null_count, unique_count = result
-
-                metadata.append({
-                    "column_name": column_name,
-                    "data_type": data_type,
-                    "total_rows": total_rows,
-                    "null_count": null_count,
-                    "unique_count": unique_count,
-                })
-
-            self.metadata = metadata
+            # Keep the Arrow table for display (st.dataframe takes it without
+            # conversion) and the records for programmatic use
+            result = self.conn.execute(query)
+            # to_arrow_table replaces fetch_arrow_table in newer DuckDB releases
+            self.metadata_arrow = (
+                result.to_arrow_table()
+                if hasattr(result, "to_arrow_table")
+                else result.fetch_arrow_table()
+            )
+            self.metadata = self.metadata_arrow.to_pylist()
+            self._metadata_table = self.table_name
             logger.info("Metadata extracted successfully.")
         except Exception as e:
             logger.error(f"Error extracting metadata: {e}")
+            self.metadata_arrow = None
             self.metadata = []  # Set an empty list if extraction fails
 
 
-    def column_summary(self, column_name):
+    def _cache_column_types(self):
         """
-        Generate summary statistics for a specific column.
+        Cache the column name -> data type mapping for the current table and
+        drop the summary statements prepared for the previous one.
         """
-        try:
-            # Determine the data type of the column
-            data_type_query = f"""
-                SELECT data_type
-                FROM information_schema.columns
-                WHERE table_name = '{self.table_name}' AND column_name = '{column_name}';
+        query = """
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_name = ?
+            ORDER BY ordinal_position;
+        """
+        self._col_types = dict(self.conn.execute(query, [self.table_name]).fetchall())
+        self._deallocate_column_summaries()
+
+    def _column_summary_queries(self, column_name, data_type):
+        """
+        Build the statistics query and the distinct values query for a column
+        of the given data type.
+        """
+        column = quote_identifier(column_name)
+
+        if is_numeric_type(data_type):
+            # Summary for numeric columns
+            stats = f"""
+                MIN({column}) AS min_value,
+                MAX({column}) AS max_value,
+                AVG({column}) AS mean_value,
+                STDDEV({column}) AS std_dev,
             """
-            data_type = self.conn.execute(data_type_query).fetchone()[0]
+        elif data_type == "DATE":
+            # Summary for date columns (min and max)
+            stats = f"""
+                MIN({column}) AS min_value,
+                MAX({column}) AS max_value,
+            """
+        else:
+            # Summary for non-numeric columns (unique count and null count)
+            stats = ""
+
+        stats_query = f"""
+            SELECT {stats}
+                COUNT(DISTINCT {column}) AS unique_count,
+                COUNT(*) - COUNT({column}) AS null_count
+            FROM {self._table}
+        """
+        # Only run when there are 5 or fewer distinct values: collecting them in
+        # the statistics scan costs more than this extra scan on
+        # high-cardinality columns
+        distinct_query = f"""
+            SELECT DISTINCT {column}
+            FROM {self._table}
+            ORDER BY {column}
+            LIMIT 5
+        """
+        return stats_query, distinct_query
 
-            if data_type in ("INTEGER", "BIGINT", "DOUBLE", "DECIMAL"):
-                # Summary for numeric columns
-                query = f"""
-                    SELECT 
-                        MIN({column_name}) AS min_value,
-                        MAX({column_name}) AS max_value,
-                        AVG({column_name}) AS mean_value,
-                        STDDEV({column_name}) AS std_dev,
-                        COUNT(DISTINCT {column_name}) AS unique_count,
-                        COUNT(*) - COUNT({column_name}) AS null_count
-                    FROM {self.table_name};
-                """
-            elif data_type == "DATE":
-                # Summary for date columns (min and max)
-                query = f"""
-                    SELECT 
-                        MIN({column_name}) AS min_value,
-                        MAX({column_name}) AS max_value,
-                        COUNT(DISTINCT {column_name}) AS unique_count,
-                        COUNT(*) - COUNT({column_name}) AS null_count
-                    FROM {self.table_name};
-                """
-            else:
-                # Summary for non-numeric columns (unique count and null count)
-                query = f"""
-                    SELECT 
-                        COUNT(DISTINCT {column_name}) AS unique_count,
-                        COUNT(*) - COUNT({column_name}) AS null_count
-                    FROM {self.table_name};
-                """
+    def _deallocate_column_summaries(self):
+        """
+        Drop the summary statements prepared for the current table.
+        """
+        for statements in self._summary_statements.values():
+            for statement in statements:
+                self.conn.execute(f"DEALLOCATE {statement}")
+        self._summary_statements = {}
 
-            summary = self.conn.execute(query).fetchdf().to_dict(orient="records")[0]
+    def _prepare_column_summary(self, column_name):
+        """
+        Prepare the summary statements for a column the first time it is
+        summarised, so later calls only have to execute them instead of
+        building, parsing and planning the queries again.
+        """
+        if column_name not in self._summary_statements:
+            i = len(self._summary_statements)
+            statements = (f"looksee_summary_{i}", f"looksee_distinct_{i}")
+            queries = self._column_summary_queries(column_name, self.column_type(column_name))
+            try:
+                for statement, query in zip(statements, queries):
+                    self.conn.execute(f"PREPARE {statement} AS {query}")
+            except Exception:
+                for statement in statements:
+                    self.conn.execute(f"DEALLOCATE {statement}")
+                raise
+            self._summary_statements[column_name] = statements
+        return self._summary_statements[column_name]
+
+    @property
+    def columns(self):
+        """
+        Column names of the current table, in table order.
+        """
+        return list(self._col_types)
+
+    def column_type(self, column_name):
+        """
+        Data type of a column in the current table. Raises KeyError for an
+        unknown column.
+        """
+        return self._col_types[column_name]
+
+    def column_summary(self, column_name):
+        """
+        Generate summary statistics for a specific column.
+        """
+        try:
+            stats_statement, distinct_statement = self._prepare_column_summary(column_name)
+            cursor = self.conn.execute(f"EXECUTE {stats_statement}")
+            names = [description[0] for description in cursor.description]
+            summary = dict(zip(names, cursor.fetchone()))
 
             # Add distinct values if unique count is 5 or less
             if summary["unique_count"] <= 5:
-                distinct_query = f"""
-                    SELECT DISTINCT {column_name}
-                    FROM {self.table_name}
-                    ORDER BY {column_name}
-                    LIMIT 5;
-                """
-                distinct_values = self.conn.execute(distinct_query).fetchall()
+                distinct_values = self.conn.execute(f"EXECUTE {distinct_statement}").fetchall()
                 summary["distinct_values"] = [value[0] for value in distinct_values]
 
             return summary
@@ -211,19 +500,22 @@ class LookSee:
         """
         return self.metadata
 
-    def render_and_publish_quarto(self, qmd_file, server_url):
+    def render_and_publish_quarto(self, qmd_file, server_url, render_only=False):
         """
         Render and publish a Quarto .qmd file to Posit Connect.
+        `quarto publish` renders the document itself, so only one Quarto
+        process is run.
         :param qmd_file: Path to the Quarto .qmd file.
         :param server_url: URL of the Posit Connect server.
+        :param render_only: Only render the document locally, without publishing.
         """
         try:
-            # Step 1: Render the .qmd file locally
-            render_command = ["quarto", "render", qmd_file]
-            logger.info(f"Rendering Quarto document: {' '.join(render_command)}")
-            subprocess.run(render_command, check=True)
+            if render_only:
+                render_command = ["quarto", "render", qmd_file]
+                logger.info(f"Rendering Quarto document: {' '.join(render_command)}")
+                subprocess.run(render_command, check=True)
+                return
 
-            # Step 2: Publish the rendered document to Posit Connect
             publish_command = [
                 "quarto",
                 "publish",
@@ -273,8 +565,8 @@ def print_column_summary(column_name, summary):
 
 def main():
     # Load demo datasets from TOML file
-    with open(Path.cwd() / "app" / "demo_datasets.toml", "r") as f:
-        demo_datasets = toml.load(f)["datasets"]
+    with open(Path.cwd() / "app" / "demo_datasets.toml", "rb") as f:
+        demo_datasets = tomllib.load(f)["datasets"]
 
     # Initialize LookSee
     looksee = LookSee()
@@ -298,12 +590,8 @@ def main():
             else:
                 print("Failed to extract metadata.")
 
-            # Get column names
-            columns_query = f"SELECT column_name FROM information_schema.columns WHERE table_name='{looksee.table_name}'"
-            columns = [col[0] for col in looksee.conn.execute(columns_query).fetchall()]
-
             # Display summary for each column
-            for column in columns:
+            for column in looksee.columns:
                 summary = looksee.column_summary(column)
                 print_column_summary(column, summary)
         else:
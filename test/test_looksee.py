@@ -1,13 +1,16 @@
 import pytest
-from src.looksee import LookSee
+from concurrent.futures import ThreadPoolExecutor
+from src.looksee import LookSee, quote_identifier
 from pathlib import Path
 
 SAMPLE_DATA_CSV = Path.cwd() / "test" / "sample_test_data.csv"
 
 
 @pytest.fixture
-def looksee_instance():
-    return LookSee()
+def looksee_instance(tmp_path):
+    looksee = LookSee()
+    looksee.cache_dir = tmp_path / "cache"
+    return looksee
 
 
 def test_ingest_data(looksee_instance):
@@ -18,9 +21,197 @@ def test_extract_metadata(looksee_instance):
     looksee_instance.ingest_data(SAMPLE_DATA_CSV)
     looksee_instance.extract_metadata()
     assert len(looksee_instance.metadata) > 0
+    assert looksee_instance.metadata_arrow.num_rows == len(looksee_instance.metadata)
 
 
 def test_column_summary(looksee_instance):
     looksee_instance.ingest_data(SAMPLE_DATA_CSV)
     summary = looksee_instance.column_summary("age")
     assert "min_value" in summary and "max_value" in summary
+
+
+def test_extract_metadata_fields(looksee_instance):
+    looksee_instance.ingest_data(SAMPLE_DATA_CSV)
+    looksee_instance.extract_metadata()
+    age = next(m for m in looksee_instance.metadata if m["column_name"] == "age")
+    assert age["null_count"] == 0
+    assert age["total_rows"] > 0
+    assert {"data_type", "unique_count"} <= age.keys()
+
+
+def test_extract_metadata_null_count(looksee_instance, tmp_path):
+    data_file = tmp_path / "nulls.csv"
+    data_file.write_text("a,b\n1,x\n,y\n3,\n,\n")
+    looksee_instance.ingest_data(data_file)
+    looksee_instance.extract_metadata()
+    null_counts = {m["column_name"]: m["null_count"] for m in looksee_instance.metadata}
+    assert null_counts == {"a": 2, "b": 2}
+
+
+def test_column_summary_distinct_values(looksee_instance):
+    looksee_instance.ingest_data(SAMPLE_DATA_CSV)
+    summary = looksee_instance.column_summary("city")
+    assert summary["distinct_values"] == ["London", "New York", "Paris"]
+    assert summary["null_count"] == 0
+
+
+def test_ingest_data_caches_parquet(looksee_instance, tmp_path):
+    data_file = tmp_path / "data.csv"
+    data_file.write_text("a,b\n1,x\n")
+    signature = looksee_instance._file_signature(str(data_file), "csv")
+    parquet_path = looksee_instance._cache_path(signature, "read_csv")
+    assert looksee_instance.ingest_data(data_file) is True
+    assert list(looksee_instance.cache_dir.glob("*.parquet")) == [parquet_path]
+
+    # Converting the same file again reuses the cached file
+    mtime = parquet_path.stat().st_mtime_ns
+    cached = looksee_instance._cache_as_parquet(str(data_file), signature, "read_csv")
+    assert cached == parquet_path
+    assert parquet_path.stat().st_mtime_ns == mtime
+
+
+def test_ingest_parquet_is_not_cached(looksee_instance, tmp_path):
+    parquet_file = tmp_path / "data.parquet"
+    looksee_instance.conn.execute(
+        f"COPY (SELECT 1 AS a) TO '{parquet_file}' (FORMAT PARQUET)"
+    )
+    assert looksee_instance.ingest_data(parquet_file) is True
+    assert looksee_instance.columns == ["a"]
+    assert not looksee_instance.cache_dir.exists()
+
+
+def test_quote_identifier():
+    assert quote_identifier('my "col"') == '"my ""col"""'
+
+
+def test_validate_column_types(looksee_instance, tmp_path):
+    data_file = tmp_path / "mixed.csv"
+    data_file.write_text('"odd ""name",code,score\n1,A1,1.5\nx,2,\n3,B3,2.5\n')
+    looksee_instance.ingest_data(data_file)
+    assert looksee_instance.validate_column_types() == []
+
+    # Expect integers where the file has text, as a stricter schema would
+    looksee_instance._col_types['odd "name'] = "INTEGER"
+    looksee_instance._col_types["code"] = "INTEGER"
+    assert looksee_instance.validate_column_types() == [
+        "Column odd \"name has 1 rows that don't match type INTEGER",
+        "Column code has 2 rows that don't match type INTEGER",
+    ]
+
+
+def test_ingest_data_reingests_changed_file(looksee_instance, tmp_path):
+    data_file = tmp_path / "data.csv"
+    data_file.write_text("a,b\n1,x\n")
+    assert looksee_instance.ingest_data(data_file) is True
+    assert looksee_instance.ingest_data(data_file) is True
+
+    data_file.write_text("a,b\n1,x\n2,y\n3,z\n")
+    assert looksee_instance.ingest_data(data_file) is True
+    assert looksee_instance.column_summary("a")["max_value"] == 3
+
+
+def test_columns(looksee_instance):
+    looksee_instance.ingest_data(SAMPLE_DATA_CSV)
+    assert looksee_instance.columns == ["name", "age", "city"]
+    assert looksee_instance.column_type("age") == "BIGINT"
+
+
+def test_instances_share_ingested_data(looksee_instance):
+    looksee_instance.ingest_data(SAMPLE_DATA_CSV)
+    other = LookSee()
+    other.cache_dir = looksee_instance.cache_dir
+    assert other.ingest_data(SAMPLE_DATA_CSV) is True
+    assert other.columns == looksee_instance.columns
+
+
+def test_cache_keeps_at_most_cache_max_files(looksee_instance, tmp_path):
+    looksee_instance.cache_max_files = 1
+    for name in ("first.csv", "second.csv"):
+        data_file = tmp_path / name
+        data_file.write_text("a\n1\n")
+        assert looksee_instance.ingest_data(data_file) is True
+    assert len(list(looksee_instance.cache_dir.glob("*.parquet"))) == 1
+
+
+def test_instances_keep_their_own_dataset(looksee_instance, tmp_path):
+    x_file = tmp_path / "x.csv"
+    x_file.write_text("a\n1\n2\n")
+    y_file = tmp_path / "y.csv"
+    y_file.write_text("b\nfoo\n")
+    other = LookSee()
+    other.cache_dir = looksee_instance.cache_dir
+    assert looksee_instance.ingest_data(x_file) is True
+    assert other.ingest_data(y_file) is True
+
+    assert looksee_instance.column_summary("a")["max_value"] == 2
+    looksee_instance.extract_metadata()
+    assert [m["column_name"] for m in looksee_instance.metadata] == ["a"]
+
+
+def test_concurrent_conversions_of_the_same_file(looksee_instance, tmp_path):
+    data_file = tmp_path / "data.csv"
+    data_file.write_text("a\n" + "\n".join(str(i) for i in range(100000)) + "\n")
+    instances = [looksee_instance]
+    for _ in range(3):
+        other = LookSee()
+        other.cache_dir = looksee_instance.cache_dir
+        instances.append(other)
+
+    with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+        results = list(executor.map(lambda looksee: looksee.ingest_data(data_file), instances))
+
+    assert results == [True] * len(instances)
+    assert not list(looksee_instance.cache_dir.glob("*.tmp"))
+
+
+def test_prune_keeps_files_used_by_views(looksee_instance, tmp_path):
+    looksee_instance.cache_max_files = 1
+    other = LookSee()
+    other.cache_dir = looksee_instance.cache_dir
+    other.cache_max_files = 1
+    x_file = tmp_path / "x.csv"
+    x_file.write_text("a\n1\n")
+    y_file = tmp_path / "y.csv"
+    y_file.write_text("b\n2\n")
+
+    assert looksee_instance.ingest_data(x_file) is True
+    assert other.ingest_data(y_file) is True
+    assert looksee_instance.ingest_data(x_file) is True
+    assert looksee_instance.column_summary("a")["max_value"] == 1
+
+
+def test_ingest_data_reconverts_missing_cache_file(looksee_instance, tmp_path):
+    data_file = tmp_path / "data.csv"
+    data_file.write_text("a\n1\n")
+    assert looksee_instance.ingest_data(data_file) is True
+    for path in looksee_instance.cache_dir.glob("*.parquet"):
+        path.unlink()
+
+    assert looksee_instance.ingest_data(data_file) is True
+    assert looksee_instance.column_summary("a")["max_value"] == 1
+
+
+def test_column_summary_prepares_statements_lazily(looksee_instance):
+    looksee_instance.ingest_data(SAMPLE_DATA_CSV)
+    assert looksee_instance._summary_statements == {}
+    looksee_instance.column_summary("age")
+    looksee_instance.column_summary("age")
+    assert list(looksee_instance._summary_statements) == ["age"]
+    assert looksee_instance.column_summary("missing") == {}
+
+
+def test_extract_metadata_only_scans_after_new_data(looksee_instance, tmp_path):
+    data_file = tmp_path / "data.csv"
+    data_file.write_text("a\n1\n")
+    looksee_instance.ingest_data(data_file)
+    looksee_instance.extract_metadata()
+    metadata_arrow = looksee_instance.metadata_arrow
+
+    assert looksee_instance.ingest_data(data_file) is True
+    looksee_instance.extract_metadata()
+    assert looksee_instance.metadata_arrow is metadata_arrow
+
+    data_file.write_text("a\n1\n2\n")
+    looksee_instance.ingest_data(data_file)
+    looksee_instance.extract_metadata()
+    assert looksee_instance.metadata[0]["total_rows"] == 2